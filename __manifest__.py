@@ -17,13 +17,19 @@ Features:
 * Real-time balance calculation
 * Keyboard shortcuts support
 * Based on account_reconcile_oca structure
+* Batch auto reconciliation service for odoo-bin shell and scheduled actions
     """,
     'author': 'Your Company',
     'depends': ['account'],
     'data': [
         'security/ir.model.access.csv',
+        'security/payment_reconcile_security.xml',
+        'data/ir_cron_data.xml',
         'views/account_payment_views.xml',
+        'views/account_journal_views.xml',
+        'views/res_config_settings_views.xml',
         'views/payment_reconcile_widget_views.xml',
+        'views/payment_reconcile_log_views.xml',
     ],
     'assets': {
         'web.assets_backend': [
@@ -3,22 +3,28 @@
 # ============================================================================
 # controllers/payment_reconcile_controller.py
 
-from odoo import http
+from odoo import fields, http
 from odoo.http import request
 import json
 import logging
+import uuid
 
 _logger = logging.getLogger(__name__)
 
+# Number of candidate lines sent to the widget
+CANDIDATE_LIMIT = 100
+
 
 class PaymentReconcileController(http.Controller):
 
     @http.route('/payment_reconcile/get_data', type='json', auth='user', methods=['POST'])
-    def get_reconcile_data(self, payment_id):
+    def get_reconcile_data(self, payment_id, session_uid=None):
         """Get reconciliation data for a payment - same account only"""
         try:
             _logger.info(f"Getting reconcile data for payment ID: {payment_id}")
 
+            sync_time = request.env['account.payment']._get_reconcile_sync_time()
+
             payment = request.env['account.payment'].browse(payment_id)
             if not payment.exists():
                 return {'error': 'Payment not found'}
@@ -39,15 +45,12 @@ class PaymentReconcileController(http.Controller):
             if not payment_lines:
                 return {'error': 'No unreconciled lines found in payment for reconciliation'}
 
-            # Find other unreconciled lines from the same account and partner
-            domain = [
-                ('account_id', '=', reconcile_account.id),
-                ('partner_id', '=', payment.partner_id.id),
-                ('reconciled', '=', False),
-                ('move_id', '!=', payment.move_id.id)
-            ]
-
-            other_lines = request.env['account.move.line'].search(domain, limit=100)
+            # Find other unreconciled lines from the same account and partner,
+            # most likely matches first
+            rows = payment._get_reconcile_candidate_rows(
+                reconcile_account, sum(payment_lines.mapped('amount_residual')), limit=CANDIDATE_LIMIT
+            )
+            other_lines = request.env['account.move.line'].browse([row[0] for row in rows])
 
             data = {
                 'payment': {
@@ -62,42 +65,22 @@ class PaymentReconcileController(http.Controller):
                     'date': payment.date.strftime('%Y-%m-%d') if payment.date else '',
                     'reconcile_account_id': reconcile_account.id,
                     'reconcile_account_name': reconcile_account.name,
+                    'reconcile_tolerance': payment._get_reconcile_tolerance()[0],
                 },
                 'payment_move_lines': [],
                 'reconcilable_lines': [],
+                'session_uid': session_uid or uuid.uuid4().hex,
+                'sync_time': fields.Datetime.to_string(sync_time),
+                'candidate_limit': CANDIDATE_LIMIT,
             }
 
             # Add payment lines
             for line in payment_lines:
-                data['payment_move_lines'].append({
-                    'id': line.id,
-                    'name': line.name or line.move_id.name,
-                    'account_id': line.account_id.id,
-                    'account_name': line.account_id.name,
-                    'debit': line.debit,
-                    'credit': line.credit,
-                    'balance': line.balance,
-                    'amount_currency': line.amount_currency,
-                    'currency_id': line.currency_id.id if line.currency_id else False,
-                    'date': line.date.strftime('%Y-%m-%d') if line.date else '',
-                })
+                data['payment_move_lines'].append(self._prepare_line_data(line))
 
             # Add other reconcilable lines from same account
             for line in other_lines:
-                data['reconcilable_lines'].append({
-                    'id': line.id,
-                    'name': line.name or line.move_id.name,
-                    'account_id': line.account_id.id,
-                    'account_name': line.account_id.name,
-                    'debit': line.debit,
-                    'credit': line.credit,
-                    'balance': line.balance,
-                    'amount_currency': line.amount_currency,
-                    'currency_id': line.currency_id.id if line.currency_id else False,
-                    'date': line.date.strftime('%Y-%m-%d') if line.date else '',
-                    'ref': line.move_id.ref or '',
-                    'move_name': line.move_id.name,
-                })
+                data['reconcilable_lines'].append(self._prepare_reconcilable_line_data(line))
 
             _logger.info(
                 f"Found {len(data['payment_move_lines'])} payment lines and {len(data['reconcilable_lines'])} reconcilable lines from account {reconcile_account.name}")
@@ -107,6 +90,73 @@ class PaymentReconcileController(http.Controller):
             _logger.error(f"Error getting reconcile data: {str(e)}", exc_info=True)
             return {'error': str(e)}
 
+    def _prepare_line_data(self, line):
+        """Serialize a move line for the widget"""
+        return {
+            'id': line.id,
+            'name': line.name or line.move_id.name,
+            'account_id': line.account_id.id,
+            'account_name': line.account_id.name,
+            'debit': line.debit,
+            'credit': line.credit,
+            'balance': line.balance,
+            'amount_currency': line.amount_currency,
+            'currency_id': line.currency_id.id if line.currency_id else False,
+            'date': line.date.strftime('%Y-%m-%d') if line.date else '',
+        }
+
+    def _prepare_reconcilable_line_data(self, line):
+        """Serialize a candidate line, with its journal entry references"""
+        data = self._prepare_line_data(line)
+        data.update({
+            'ref': line.move_id.ref or '',
+            'move_name': line.move_id.name,
+        })
+        return data
+
+    @http.route('/payment_reconcile/get_delta', type='json', auth='user', methods=['POST'])
+    def get_reconcile_delta(self, payment_id, since):
+        """Get the candidate lines changed since the last sync of the widget"""
+        try:
+            _logger.info(f"Getting reconcile delta for payment ID: {payment_id} since {since}")
+
+            sync_time = request.env['account.payment']._get_reconcile_sync_time()
+
+            payment = request.env['account.payment'].browse(payment_id)
+            if not payment.exists():
+                return {'error': 'Payment not found'}
+
+            if not payment.move_id:
+                return {'error': 'Payment has no journal entry'}
+
+            reconcile_account = self._get_payment_reconcile_account(payment)
+            if not reconcile_account:
+                return {'error': 'No reconcilable account found in payment'}
+
+            # Payment lines are few, send them again to keep the balance exact
+            payment_lines = payment.move_id.line_ids.filtered(
+                lambda l: l.account_id == reconcile_account and not l.reconciled
+            )
+
+            changed_lines, removed_ids = payment._get_reconcile_candidate_changes(
+                reconcile_account, fields.Datetime.to_datetime(since)
+            )
+
+            data = {
+                'payment_move_lines': [self._prepare_line_data(line) for line in payment_lines],
+                'changed_lines': [self._prepare_reconcilable_line_data(line) for line in changed_lines],
+                'removed_line_ids': removed_ids,
+                'sync_time': fields.Datetime.to_string(sync_time),
+            }
+
+            _logger.info(
+                f"Found {len(data['changed_lines'])} changed and {len(removed_ids)} removed lines since {since}")
+            return data
+
+        except Exception as e:
+            _logger.error(f"Error getting reconcile delta: {str(e)}", exc_info=True)
+            return {'error': str(e)}
+
     def _get_payment_reconcile_account(self, payment):
         """Get the main reconcilable account from payment move"""
         # Priority order for finding reconcile account:
@@ -151,7 +201,7 @@ class PaymentReconcileController(http.Controller):
         return reconcile_lines[0].account_id
 
     @http.route('/payment_reconcile/reconcile', type='json', auth='user', methods=['POST'])
-    def reconcile_lines(self, payment_id, selected_line_ids):
+    def reconcile_lines(self, payment_id, selected_line_ids, session_uid=None):
         """Perform direct reconciliation - same account guaranteed"""
         try:
             _logger.info(f"Direct reconciling payment {payment_id} with lines {selected_line_ids}")
@@ -188,21 +238,29 @@ class PaymentReconcileController(http.Controller):
             if len(all_lines.mapped('account_id')) != 1:
                 return {'error': 'Internal error: Lines from different accounts detected'}
 
-            # Check balance
+            # Check balance, differences within the tolerance are written off
             total_balance = sum(all_lines.mapped('balance'))
-            if abs(total_balance) > 0.01:
+            tolerance = payment._get_reconcile_tolerance()[0]
+            if abs(total_balance) > max(0.01, tolerance):
                 return {
                     'error': f'Reconciliation not balanced. Total balance: {total_balance:.2f}'
                 }
 
             # Perform reconciliation using Odoo's method
             try:
-                # Use the reconcile method directly
-                reconcile_result = all_lines.reconcile()
-
-                # Check if partial reconciliation was created
-                if reconcile_result and 'partial_reconcile_ids' in reconcile_result:
-                    _logger.info("Partial reconciliation created")
+                # Roll back the write-off entry and the audit entry if the
+                # reconciliation fails
+                with request.env.cr.savepoint():
+                    log = request.env['payment.reconcile.log']._write_log([
+                        payment._reconcile_and_prepare_log(
+                            payment_lines, selected_lines, reconcile_account,
+                            'manual', 'controller', session_uid=session_uid,
+                        )
+                    ])
+
+                # Check if a difference was written off
+                if log.writeoff_move_id:
+                    _logger.info(f"Difference of {total_balance:.2f} written off in {log.writeoff_move_id.name}")
 
                 # Check if full reconciliation was achieved
                 reconciled_lines = all_lines.filtered('reconciled')
@@ -223,7 +281,7 @@ class PaymentReconcileController(http.Controller):
             return {'error': str(e)}
 
     @http.route('/payment_reconcile/auto_reconcile', type='json', auth='user', methods=['POST'])
-    def auto_reconcile_payment(self, payment_id):
+    def auto_reconcile_payment(self, payment_id, session_uid=None):
         """Attempt automatic reconciliation for the payment"""
         try:
             _logger.info(f"Auto reconciling payment {payment_id}")
@@ -245,53 +303,43 @@ class PaymentReconcileController(http.Controller):
             if not payment_lines:
                 return {'error': 'No payment lines to reconcile'}
 
-            # Find matching lines with exact opposite balance
-            payment_balance = sum(payment_lines.mapped('balance'))
-
-            # Search for lines that would create a balanced reconciliation
-            domain = [
-                ('account_id', '=', reconcile_account.id),
-                ('partner_id', '=', payment.partner_id.id),
-                ('reconciled', '=', False),
-                ('move_id', '!=', payment.move_id.id)
-            ]
-
-            candidate_lines = request.env['account.move.line'].search(domain)
-
-            # Try to find exact match first
-            for line in candidate_lines:
-                if abs(line.balance + payment_balance) < 0.01:
-                    try:
-                        all_lines = payment_lines | line
-                        all_lines.reconcile()
-                        return {
-                            'success': True,
-                            'message': f'Auto-reconciled with {line.move_id.name}'
-                        }
-                    except:
-                        continue
-
-            # Try combinations for multiple invoices
-            if len(candidate_lines) > 1:
-                from itertools import combinations
-                for combo_size in range(2, min(6, len(candidate_lines) + 1)):
-                    for combo in combinations(candidate_lines, combo_size):
-                        combo_balance = sum([l.balance for l in combo])
-                        if abs(combo_balance + payment_balance) < 0.01:
-                            try:
-                                all_lines = payment_lines
-                                for line in combo:
-                                    all_lines |= line
-                                all_lines.reconcile()
-                                return {
-                                    'success': True,
-                                    'message': f'Auto-reconciled with {len(combo)} entries'
-                                }
-                            except:
-                                continue
+            # Exact matches are tried before combinations of multiple invoices
+            matched_lines = payment._auto_reconcile_lines(
+                payment_lines, reconcile_account, origin='controller',
+                session_uid=session_uid
+            )
+            if matched_lines:
+                if len(matched_lines) == 1:
+                    message = f'Auto-reconciled with {matched_lines.move_id.name}'
+                else:
+                    message = f'Auto-reconciled with {len(matched_lines)} entries'
+                return {'success': True, 'message': message}
 
             return {'error': 'No matching entries found for automatic reconciliation'}
 
         except Exception as e:
             _logger.error(f"Error in auto reconciliation: {str(e)}", exc_info=True)
+            return {'error': str(e)}
+
+    @http.route('/payment_reconcile/undo_session', type='json', auth='user', methods=['POST'])
+    def undo_session(self, session_uid):
+        """Remove every reconciliation made during a widget session"""
+        try:
+            _logger.info(f"Undoing reconcile session {session_uid}")
+
+            if not session_uid:
+                return {'error': 'No reconciliation session to undo'}
+
+            # Undo the whole session or nothing of it
+            with request.env.cr.savepoint():
+                removed = request.env['payment.reconcile.log']._undo_session(session_uid)
+            if not removed:
+                return {'error': 'Nothing was reconciled in this session'}
+
+            message = f"{removed} reconciliations undone"
+            _logger.info(message)
+            return {'success': True, 'message': message}
+
+        except Exception as e:
+            _logger.error(f"Error undoing reconcile session: {str(e)}", exc_info=True)
             return {'error': str(e)}
\ No newline at end of file
@@ -4,4 +4,9 @@
 # models/__init__.py
 
 from . import account_payment
-from . import payment_reconcile_widget
\ No newline at end of file
+from . import payment_reconcile_widget
+from . import payment_reconcile_log
+from . import account_journal
+from . import res_company
+from . import res_config_settings
+from . import payment_reconcile_service
@@ -0,0 +1,32 @@
+# ============================================================================
+# ACCOUNT JOURNAL MODEL EXTENSION
+# ============================================================================
+# models/account_journal.py
+
+from odoo import models, fields
+
+
+class AccountJournal(models.Model):
+    _inherit = 'account.journal'
+
+    company_currency_id = fields.Many2one(
+        'res.currency',
+        related='company_id.currency_id',
+        string='Company Currency',
+        readonly=True
+    )
+
+    payment_reconcile_tolerance = fields.Monetary(
+        string='Payment Reconcile Tolerance',
+        currency_field='company_currency_id',
+        help='Largest difference written off for payments of this journal; '
+             'used instead of the company tolerance when a write-off account is set'
+    )
+
+    payment_reconcile_writeoff_account_id = fields.Many2one(
+        'account.account',
+        string='Payment Write-off Account',
+        check_company=True,
+        help='When set, this account and the journal tolerance override the company settings '
+             'for payments of this journal'
+    )
@@ -3,8 +3,30 @@
 # ============================================================================
 # models/account_payment.py
 
+import logging
+import time
+from datetime import timedelta
+
 from odoo import models, fields, api, _
-from odoo.exceptions import UserError
+from odoo.exceptions import AccessError, UserError
+
+from ..tools.reconcile_matcher import (
+    COMBINATION_SEARCH_LIMIT, MAX_COMBO_SIZE, ReconcileMatcher, to_cents,
+)
+
+_logger = logging.getLogger(__name__)
+
+# Audit strategy recorded for a match, by number of matched lines
+MATCH_STRATEGIES = {1: 'exact', 2: 'pair'}
+
+# Candidate ordering keys, in tie-break order after the company priority
+CANDIDATE_ORDER_KEYS = ('reference', 'due_date', 'amount')
+
+# Overlap between two candidate syncs, on top of the oldest open transaction
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# Furthest a candidate sync looks back for long running transactions
+SYNC_MAX_LOOKBACK = timedelta(minutes=15)
 
 
 class AccountPayment(models.Model):
@@ -32,12 +54,7 @@ class AccountPayment(models.Model):
 
                 if reconcile_account:
                     # Count lines from same account and partner
-                    domain = [
-                        ('account_id', '=', reconcile_account.id),
-                        ('partner_id', '=', payment.partner_id.id),
-                        ('reconciled', '=', False),
-                        ('move_id', '!=', payment.move_id.id)
-                    ]
+                    domain = payment._get_reconcile_candidate_domain(reconcile_account)
                     count = self.env['account.move.line'].search_count(domain)
 
             payment.reconcile_move_line_count = count
@@ -80,6 +97,282 @@ class AccountPayment(models.Model):
         # Fallback: First reconcilable account
         return reconcile_lines[0].account_id
 
+    def _get_reconcile_candidate_domain(self, reconcile_account, include_reconciled=False):
+        """Domain of lines that can offset this payment, unreconciled ones only
+        unless ``include_reconciled`` is set"""
+        self.ensure_one()
+        domain = [
+            ('account_id', '=', reconcile_account.id),
+            ('partner_id', '=', self.partner_id.id),
+            ('move_id', '!=', self.move_id.id)
+        ]
+        if not include_reconciled:
+            domain.append(('reconciled', '=', False))
+        return domain
+
+    def _get_reconcile_candidate_order(self, payment_residual):
+        """Return the ORDER BY clause serving the likely candidates first, with its params
+
+        The company priority key comes first, the other keys break ties:
+        same reference as the payment memo, oldest due date, and residual
+        closest to offsetting ``payment_residual``.
+        """
+        self.ensure_one()
+        priority = self.company_id.payment_reconcile_candidate_order or 'due_date'
+        expressions = {
+            'due_date': ('COALESCE("account_move_line"."date_maturity", "account_move_line"."date") ASC', []),
+            'amount': ('ABS("account_move_line"."amount_residual" + %s) ASC', [payment_residual]),
+            'reference': (
+                'CASE WHEN %s IN ("account_move_line"."ref", "account_move_line"."move_name") '
+                'THEN 0 ELSE 1 END ASC', [self.ref]
+            ) if self.ref else None,
+        }
+        keys = [priority] + [key for key in CANDIDATE_ORDER_KEYS if key != priority]
+        terms = [expressions[key] for key in keys if expressions[key]]
+        terms.append(('"account_move_line"."id" ASC', []))
+        return ', '.join(term for term, _params in terms), [
+            param for _term, params in terms for param in params
+        ]
+
+    def _get_reconcile_candidate_rows(self, reconcile_account, payment_residual, limit=None,
+                                      exclude_line_ids=None):
+        """Return ``(id, amount_residual)`` rows of the candidate lines, in priority order
+
+        Ordering needs expressions the ORM ``order`` cannot express, so the
+        candidate domain is compiled into a query, with record rules applied.
+        Residuals are returned so partially reconciled lines match on what is
+        left to reconcile. Lines of ``exclude_line_ids`` are left out.
+        """
+        self.ensure_one()
+        Line = self.env['account.move.line']
+        Line.flush_model([
+            'account_id', 'partner_id', 'reconciled', 'move_id', 'amount_residual',
+            'date', 'date_maturity', 'ref', 'move_name',
+        ])
+        domain = self._get_reconcile_candidate_domain(reconcile_account)
+        if exclude_line_ids:
+            domain.append(('id', 'not in', list(exclude_line_ids)))
+        query = Line._where_calc(domain)
+        Line._apply_ir_rules(query, 'read')
+        query_str, params = query.select(
+            '"account_move_line"."id"', '"account_move_line"."amount_residual"'
+        )
+        # The order depends on the payment memo, passed as a query parameter
+        order_str, order_params = self._get_reconcile_candidate_order(payment_residual)
+        query_str += ' ORDER BY ' + order_str
+        params = list(params) + order_params
+        if limit:
+            query_str += ' LIMIT %s'
+            params.append(limit)
+        self.env.cr.execute(query_str, params)
+        return self.env.cr.fetchall()
+
+    @api.model
+    def _get_reconcile_sync_time(self):
+        """Timestamp from which the next candidate delta must search
+
+        ``write_date`` is the start time of the writing transaction, so a
+        transaction still open now commits lines dated before now. The sync
+        starts from the oldest open client transaction of the database, minus
+        a margin; reading a line twice is harmless. Background workers and
+        long cron transactions would hold the stamp back for hours, so it
+        goes back ``SYNC_MAX_LOOKBACK`` at most.
+        """
+        self.env.cr.execute("""
+            SELECT GREATEST(LEAST(MIN(xact_start), now()), now() - %s) AT TIME ZONE 'UTC'
+              FROM pg_stat_activity
+             WHERE datname = current_database()
+               AND backend_type = 'client backend'
+               AND xact_start IS NOT NULL
+        """, [SYNC_MAX_LOOKBACK])
+        return self.env.cr.fetchone()[0] - SYNC_OVERLAP
+
+    def _get_reconcile_candidate_changes(self, reconcile_account, since):
+        """Candidate lines written since ``since``, split by availability
+
+        Returns a ``(changed_lines, removed_ids)`` tuple: unreconciled lines
+        added or modified since the last sync, and the ids of lines that got
+        reconciled meanwhile.
+        """
+        self.ensure_one()
+        # Same candidates as the widget, reconciled ones included
+        domain = self._get_reconcile_candidate_domain(reconcile_account, include_reconciled=True)
+        domain += [('write_date', '>=', since)]
+        lines = self.env['account.move.line'].search(domain)
+        changed_lines = lines.filtered(lambda l: not l.reconciled)
+        return changed_lines, (lines - changed_lines).ids
+
+    def _get_reconcile_tolerance(self):
+        """Return the write-off tolerance and account for this payment
+
+        A journal with its own write-off account overrides the company
+        settings, tolerance included, even when its tolerance is zero.
+        Without a write-off account nothing can absorb a difference, so the
+        tolerance is zero.
+        """
+        self.ensure_one()
+        journal = self.journal_id
+        if journal.payment_reconcile_writeoff_account_id:
+            return journal.payment_reconcile_tolerance, journal.payment_reconcile_writeoff_account_id
+
+        company = self.company_id
+        if not company.payment_reconcile_writeoff_account_id:
+            return 0.0, company.payment_reconcile_writeoff_account_id
+        return company.payment_reconcile_tolerance, company.payment_reconcile_writeoff_account_id
+
+    def _create_reconcile_writeoff(self, amount, reconcile_account, writeoff_account):
+        """Post an entry moving ``amount`` from the reconcile account to the write-off account
+
+        Returns the line on the reconcile account, to be reconciled with the
+        lines it balances.
+        """
+        self.ensure_one()
+        common_vals = {
+            'name': _('Write-off: %s') % self.name,
+            'partner_id': self.partner_id.id,
+        }
+        move = self.env['account.move'].create({
+            'move_type': 'entry',
+            'journal_id': self.journal_id.id,
+            'date': fields.Date.context_today(self),
+            'ref': _('Write-off: %s') % self.name,
+            'line_ids': [
+                (0, 0, dict(common_vals,
+                            account_id=reconcile_account.id,
+                            debit=max(-amount, 0.0),
+                            credit=max(amount, 0.0))),
+                (0, 0, dict(common_vals,
+                            account_id=writeoff_account.id,
+                            debit=max(amount, 0.0),
+                            credit=max(-amount, 0.0))),
+            ],
+        })
+        move.action_post()
+        return move.line_ids.filtered(lambda l: l.account_id == reconcile_account)
+
+    def _reconcile_with_writeoff(self, lines, reconcile_account):
+        """Reconcile lines, writing off a residual within the tolerance
+
+        Returns the write-off entry, or an empty recordset when the lines
+        balance or the residual exceeds the tolerance.
+        """
+        self.ensure_one()
+        writeoff_move = self.env['account.move']
+        tolerance, writeoff_account = self._get_reconcile_tolerance()
+        currency = self.company_id.currency_id
+        residual = sum(lines.mapped('amount_residual'))
+
+        if (writeoff_account and not currency.is_zero(residual)
+                and currency.compare_amounts(abs(residual), tolerance) <= 0):
+            writeoff_line = self._create_reconcile_writeoff(residual, reconcile_account, writeoff_account)
+            writeoff_move = writeoff_line.move_id
+            lines |= writeoff_line
+
+        lines.reconcile()
+        return writeoff_move
+
+    def _reconcile_and_prepare_log(self, payment_lines, matched_lines, reconcile_account,
+                                   strategy, origin, match_duration=0.0, session_uid=False):
+        """Reconcile the payment lines with ``matched_lines`` and return the audit entry values
+
+        The partial reconciles created are found by diffing the ones linked
+        to the lines before and after reconciling. Callers run this in a
+        savepoint, together with writing the entry.
+        """
+        self.ensure_one()
+        Log = self.env['payment.reconcile.log']
+        all_lines = payment_lines | matched_lines
+        reconcile_start = time.perf_counter()
+        existing_partials = Log._get_line_partials(all_lines)
+        writeoff_move = self._reconcile_with_writeoff(all_lines, reconcile_account)
+        return Log._prepare_log_vals(
+            self, payment_lines, matched_lines, strategy, origin,
+            match_duration=match_duration,
+            reconcile_duration=time.perf_counter() - reconcile_start,
+            partials=Log._get_line_partials(all_lines) - existing_partials,
+            writeoff_move=writeoff_move,
+            session_uid=session_uid,
+        )
+
+    def _check_reconcile_payment_lines(self, payment_lines):
+        """Raise when the payment lines themselves cannot be reconciled
+
+        Lock dates, access rights and the state of the payment lines make
+        every candidate combination fail the same way, so they are checked
+        once before searching.
+        """
+        self.ensure_one()
+        if any(line.parent_state != 'posted' or line.reconciled for line in payment_lines):
+            raise UserError(_("The payment lines of %s are not open for reconciliation.") % self.name)
+        payment_lines.check_access_rights('write')
+        payment_lines.check_access_rule('write')
+        payment_lines.move_id._check_fiscalyear_lock_date()
+
+    def _auto_reconcile_lines(self, payment_lines, reconcile_account, origin='payment',
+                              max_size=MAX_COMBO_SIZE, limit=None, log_entries=None,
+                              session_uid=False, dry_run=False,
+                              search_limit=COMBINATION_SEARCH_LIMIT, exclude_line_ids=None):
+        """Reconcile payment lines with the first balancing candidate combination
+
+        Candidate ids and residuals are loaded once into the matcher, most
+        likely lines first; records are only browsed for the combinations it
+        returns. Combinations within the configured tolerance also match, the
+        difference being written off. ``max_size`` and ``search_limit`` bound
+        the search. Returns the matched lines, or an empty recordset when
+        nothing balances the payment.
+
+        The audit entry of a successful match is appended to ``log_entries``
+        when given, so batch callers can store them all at once. It is tagged
+        with ``session_uid`` so the whole run can be undone later. With
+        ``dry_run`` the first match is returned without reconciling it; lines
+        of ``exclude_line_ids``, already claimed by earlier matches, are not
+        candidates.
+        """
+        self.ensure_one()
+        lines = self.env['account.move.line']
+        try:
+            self._check_reconcile_payment_lines(payment_lines)
+        except (AccessError, UserError) as error:
+            _logger.debug("Payment %s cannot be auto reconciled: %s", self.name, error)
+            return lines
+
+        start = time.perf_counter()
+        digits = self.company_id.currency_id.decimal_places
+        payment_residual = sum(payment_lines.mapped('amount_residual'))
+        matcher = ReconcileMatcher.from_rows(
+            self._get_reconcile_candidate_rows(
+                reconcile_account, payment_residual, limit=limit, exclude_line_ids=exclude_line_ids
+            ),
+            digits=digits,
+        )
+        target = -to_cents(payment_residual, digits)
+        tolerance = to_cents(self._get_reconcile_tolerance()[0], digits)
+
+        Log = self.env['payment.reconcile.log']
+        for line_ids in matcher.iter_matches(target, max_size=max_size, tolerance=tolerance,
+                                             search_limit=search_limit):
+            candidate_lines = lines.browse(line_ids)
+            if dry_run:
+                return candidate_lines
+            try:
+                with self.env.cr.savepoint():
+                    vals = self._reconcile_and_prepare_log(
+                        payment_lines, candidate_lines, reconcile_account,
+                        MATCH_STRATEGIES.get(len(candidate_lines), 'combination'), origin,
+                        match_duration=time.perf_counter() - start,
+                        session_uid=session_uid,
+                    )
+            except Exception as error:
+                _logger.debug("Reconciling payment %s with lines %s failed: %s",
+                              self.name, list(line_ids), error)
+                continue
+            if log_entries is None:
+                Log._write_log([vals])
+            else:
+                log_entries.append(vals)
+            return candidate_lines
+        return lines
+
     def action_open_reconcile_widget(self):
         """Open the direct reconciliation widget"""
         self.ensure_one()
@@ -153,35 +446,18 @@ class AccountPayment(models.Model):
         if not payment_lines:
             raise UserError(_("No unreconciled payment lines found."))
 
-        # Find matching lines with opposite balance
-        payment_balance = sum(payment_lines.mapped('balance'))
-
-        domain = [
-            ('account_id', '=', reconcile_account.id),
-            ('partner_id', '=', self.partner_id.id),
-            ('reconciled', '=', False),
-            ('move_id', '!=', self.move_id.id)
-        ]
-
-        candidate_lines = self.env['account.move.line'].search(domain)
-
         # Try exact match first
-        for line in candidate_lines:
-            if abs(line.balance + payment_balance) < 0.01:
-                try:
-                    all_lines = payment_lines | line
-                    all_lines.reconcile()
-                    return {
-                        'type': 'ir.actions.client',
-                        'tag': 'display_notification',
-                        'params': {
-                            'title': _('Success'),
-                            'message': _('Payment reconciled with %s') % line.move_id.name,
-                            'type': 'success',
-                        }
-                    }
-                except Exception as e:
-                    continue
+        matched_lines = self._auto_reconcile_lines(payment_lines, reconcile_account, max_size=1)
+        if matched_lines:
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': _('Success'),
+                    'message': _('Payment reconciled with %s') % matched_lines.move_id.name,
+                    'type': 'success',
+                }
+            }
 
         # No automatic match found
-        return self.action_open_reconcile_widget()
\ No newline at end of file
+        return self.action_open_reconcile_widget()
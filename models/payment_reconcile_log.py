@@ -0,0 +1,214 @@
+# ============================================================================
+# PAYMENT RECONCILE LOG MODEL
+# ============================================================================
+# models/payment_reconcile_log.py
+
+import uuid
+
+from odoo import models, fields, api, tools, _
+from odoo.exceptions import UserError
+from odoo.tools import split_every
+
+# Number of partial reconciles removed per unlink when undoing a session
+UNDO_CHUNK_SIZE = 1000
+
+
+class PaymentReconcileLog(models.Model):
+    _name = 'payment.reconcile.log'
+    _description = 'Payment Reconciliation Audit Log'
+    _order = 'date desc, id desc'
+    _log_access = False
+
+    date = fields.Datetime(
+        string='Date',
+        required=True,
+        readonly=True,
+        index=True,
+        default=fields.Datetime.now
+    )
+
+    user_id = fields.Many2one(
+        'res.users',
+        string='User',
+        readonly=True,
+        default=lambda self: self.env.user
+    )
+
+    company_id = fields.Many2one(
+        'res.company',
+        string='Company',
+        readonly=True
+    )
+
+    company_currency_id = fields.Many2one(
+        'res.currency',
+        related='company_id.currency_id',
+        readonly=True
+    )
+
+    session_uid = fields.Char(
+        string='Session',
+        readonly=True,
+        index=True,
+        help='Identifier shared by all reconciliations of one widget or batch run'
+    )
+
+    payment_id = fields.Many2one(
+        'account.payment',
+        string='Payment',
+        readonly=True,
+        ondelete='set null'
+    )
+
+    origin = fields.Selection([
+        ('payment', 'Payment Form'),
+        ('widget', 'Reconcile Widget'),
+        ('controller', 'Widget API'),
+        ('batch', 'Batch Run'),
+    ], string='Origin', readonly=True)
+
+    strategy = fields.Selection([
+        ('exact', 'Exact Match'),
+        ('pair', 'Pair Match'),
+        ('combination', 'Combination Match'),
+        ('manual', 'Manual Selection'),
+    ], string='Strategy', readonly=True)
+
+    line_id_list = fields.Char(
+        string='Reconciled Lines',
+        readonly=True,
+        help='Comma-separated ids of the journal items reconciled with the payment'
+    )
+
+    partial_id_list = fields.Char(
+        string='Partial Reconciles',
+        readonly=True,
+        help='Comma-separated ids of the partial reconciles created by this entry'
+    )
+
+    writeoff_move_id = fields.Many2one(
+        'account.move',
+        string='Write-off Entry',
+        readonly=True,
+        ondelete='set null'
+    )
+
+    combo_size = fields.Integer(string='Matched Lines', readonly=True)
+
+    amount_delta = fields.Monetary(
+        string='Amount Difference',
+        currency_field='company_currency_id',
+        readonly=True
+    )
+
+    match_duration = fields.Float(string='Match Time (ms)', readonly=True)
+    reconcile_duration = fields.Float(string='Reconcile Time (ms)', readonly=True)
+
+    def init(self):
+        # Audit queries filter on a date range, optionally per company or strategy
+        tools.create_index(self._cr, 'payment_reconcile_log_company_date_index',
+                           self._table, ['company_id', 'date'])
+        tools.create_index(self._cr, 'payment_reconcile_log_strategy_date_index',
+                           self._table, ['strategy', 'date'])
+        tools.create_index(self._cr, 'payment_reconcile_log_payment_index',
+                           self._table, ['payment_id'])
+
+    @api.model
+    def _get_line_partials(self, lines):
+        """Partial reconciles currently linked to the given lines"""
+        return lines.matched_debit_ids | lines.matched_credit_ids
+
+    @api.model
+    def _prepare_log_vals(self, payment, payment_lines, matched_lines, strategy, origin,
+                          match_duration=0.0, reconcile_duration=0.0,
+                          partials=None, writeoff_move=None, session_uid=False):
+        """Build the values of one audit entry, durations given in seconds
+
+        Entries logged without a session get one of their own, so any
+        reconciliation can be undone.
+        """
+        all_lines = payment_lines | matched_lines
+        return {
+            'user_id': self.env.uid,
+            'company_id': payment.company_id.id,
+            'session_uid': session_uid or uuid.uuid4().hex,
+            'payment_id': payment.id,
+            'origin': origin,
+            'strategy': strategy,
+            'line_id_list': ','.join(str(line_id) for line_id in matched_lines.ids),
+            'partial_id_list': ','.join(str(partial_id) for partial_id in partials.ids) if partials else False,
+            'writeoff_move_id': writeoff_move.id if writeoff_move else False,
+            'combo_size': len(matched_lines),
+            'amount_delta': sum(all_lines.mapped('balance')),
+            'match_duration': match_duration * 1000.0,
+            'reconcile_duration': reconcile_duration * 1000.0,
+        }
+
+    @api.model
+    def _write_log(self, vals_list):
+        """Store a batch of audit entries with a single insert"""
+        if not vals_list:
+            return self
+        return self.sudo().create(vals_list)
+
+    @api.model
+    def _undo_session(self, session_uids, chunk_size=UNDO_CHUNK_SIZE):
+        """Remove every partial reconcile created by the given sessions
+
+        Partials are unlinked in chunks, which also drops the full reconciles
+        and exchange difference entries built on top of them; write-off entries
+        of the sessions are reversed. Reconciles made outside the sessions on
+        the same lines are left untouched.
+        Returns the number of partial reconciles removed.
+        """
+        if isinstance(session_uids, str):
+            session_uids = [session_uids]
+        # Read with record rules, so only sessions of the allowed companies are undone
+        rows = self.search_read(
+            [('session_uid', 'in', list(session_uids)), ('partial_id_list', '!=', False)],
+            ['partial_id_list', 'writeoff_move_id'],
+        )
+        partial_ids = sorted({
+            int(partial_id)
+            for row in rows
+            for partial_id in row['partial_id_list'].split(',')
+        })
+        writeoff_move_ids = [row['writeoff_move_id'][0] for row in rows if row['writeoff_move_id']]
+
+        removed = 0
+        Partial = self.env['account.partial.reconcile']
+        for chunk in split_every(chunk_size, partial_ids):
+            partials = Partial.browse(chunk).exists()
+            removed += len(partials)
+            partials.unlink()
+            self.env.invalidate_all()
+
+        writeoff_moves = self.env['account.move'].browse(writeoff_move_ids).filtered(
+            lambda m: m.state == 'posted' and not m.reversal_move_id
+        )
+        if writeoff_moves:
+            writeoff_moves._reverse_moves(cancel=True)
+        return removed
+
+    def action_undo_session(self):
+        """Undo the sessions of the selected audit entries"""
+        session_uids = set(self.filtered('session_uid').mapped('session_uid'))
+        if not session_uids:
+            raise UserError(_("The selected entries do not belong to a reconciliation session."))
+
+        removed = self._undo_session(session_uids)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Success'),
+                'message': _('%d reconciliations removed from %d session(s)') % (removed, len(session_uids)),
+                'type': 'success',
+            }
+        }
+
+    def write(self, vals):
+        raise UserError(_("Reconciliation audit entries cannot be modified."))
+
+    def unlink(self):
+        raise UserError(_("Reconciliation audit entries cannot be deleted."))
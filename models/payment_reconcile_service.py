@@ -0,0 +1,179 @@
+# ============================================================================
+# PAYMENT RECONCILE SERVICE
+# ============================================================================
+# models/payment_reconcile_service.py
+
+import logging
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo import models, api
+
+_logger = logging.getLogger(__name__)
+
+# Payments reconciled per chunk; each chunk is committed with its audit entries
+BATCH_CHUNK_SIZE = 200
+
+# Batch runs stop at smaller combinations than the widget, since every
+# unmatched payment spends the whole search budget
+BATCH_MAX_COMBO_SIZE = 3
+BATCH_SEARCH_LIMIT = 10000
+
+
+class PaymentReconcileService(models.AbstractModel):
+    _name = 'payment.reconcile.service'
+    _description = 'Payment Reconciliation Batch Service'
+
+    @api.model
+    def _get_batch_payment_domain(self, company_ids=None, account_ids=None, date_from=None,
+                                  date_to=None):
+        """Domain of the posted, unreconciled payments a batch run looks at"""
+        domain = [
+            ('state', '=', 'posted'),
+            ('partner_id', '!=', False),
+            ('is_reconciled', '=', False),
+        ]
+        if company_ids:
+            domain.append(('company_id', 'in', list(company_ids)))
+        if account_ids:
+            domain.append(('move_id.line_ids.account_id', 'in', list(account_ids)))
+        if date_from:
+            domain.append(('date', '>=', date_from))
+        if date_to:
+            domain.append(('date', '<=', date_to))
+        return domain
+
+    @api.model
+    def _get_payment_chunks(self, payments, chunk_size=BATCH_CHUNK_SIZE):
+        """Split payments into chunks of about ``chunk_size`` ids, one partner per chunk
+
+        Payments of a partner compete for the same candidate lines; split over
+        parallel chunks they would lock the same rows.
+        """
+        partner_payment_ids = defaultdict(list)
+        for payment in payments:
+            partner_payment_ids[payment.partner_id.id].append(payment.id)
+
+        chunks = [[]]
+        for payment_ids in partner_payment_ids.values():
+            if len(chunks[-1]) >= chunk_size:
+                chunks.append([])
+            chunks[-1].extend(payment_ids)
+        return [chunk for chunk in chunks if chunk]
+
+    @api.model
+    def run_batch(self, company_ids=None, account_ids=None, date_from=None, date_to=None,
+                  dry_run=False, limit=None, chunk_size=BATCH_CHUNK_SIZE, workers=1,
+                  max_size=BATCH_MAX_COMBO_SIZE, search_limit=BATCH_SEARCH_LIMIT):
+        """Auto reconcile posted payments without the widget
+
+        Meant for ``odoo-bin shell`` or scheduled actions, e.g.::
+
+            env['payment.reconcile.service'].run_batch(
+                company_ids=[1], date_from='2024-01-01', dry_run=True)
+
+        Unreconciled payments are processed in chunks of ``chunk_size``, each
+        in its own cursor committed when done, so an interrupted run keeps the
+        chunks already reconciled. Only committed data is visible to the
+        chunks; with several ``workers`` they run in parallel, all payments of
+        a partner staying in the same chunk. ``max_size``
+        and ``search_limit`` bound the combination search per payment.
+        ``dry_run`` only counts the matches. All reconciliations share one
+        session, which can be undone with
+        ``payment.reconcile.log._undo_session``.
+
+        Returns the run statistics, also written to the log.
+        """
+        payments = self.env['account.payment'].search(
+            self._get_batch_payment_domain(company_ids, account_ids, date_from, date_to),
+            limit=limit, order='date, id',
+        )
+        session_uid = uuid.uuid4().hex
+        chunks = self._get_payment_chunks(payments, chunk_size)
+        options = {
+            'account_ids': set(account_ids or []),
+            'session_uid': session_uid,
+            'dry_run': dry_run,
+            'max_size': max_size,
+            'search_limit': search_limit,
+        }
+
+        start = time.perf_counter()
+        if workers > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(
+                    lambda chunk: self._run_chunk_in_cursor(chunk, **options), chunks
+                ))
+        else:
+            results = [self._run_chunk_in_cursor(chunk, **options) for chunk in chunks]
+        elapsed = time.perf_counter() - start
+
+        stats = {
+            'session_uid': session_uid,
+            'dry_run': dry_run,
+            'payments': sum(result['payments'] for result in results),
+            'matched': sum(result['matched'] for result in results),
+            'skipped': sum(result['skipped'] for result in results),
+            'queries': sum(result['queries'] for result in results),
+            'elapsed': elapsed,
+        }
+        stats['payments_per_second'] = stats['payments'] / elapsed if elapsed else 0.0
+        stats['queries_per_payment'] = stats['queries'] / stats['payments'] if stats['payments'] else 0.0
+
+        _logger.info(
+            f"Batch reconcile {'(dry run) ' if dry_run else ''}session {session_uid}: "
+            f"{stats['matched']}/{stats['payments']} payments matched, {stats['skipped']} skipped "
+            f"in {elapsed:.2f}s ({stats['payments_per_second']:.1f} payments/s, "
+            f"{stats['queries_per_payment']:.1f} queries/payment)")
+        return stats
+
+    def _run_chunk_in_cursor(self, payment_ids, **options):
+        """Reconcile a chunk in a dedicated cursor, committed unless in dry run"""
+        with self.pool.cursor() as cr:
+            env = api.Environment(cr, self.env.uid, self.env.context)
+            result = env['payment.reconcile.service']._reconcile_chunk(payment_ids, **options)
+            if options.get('dry_run'):
+                cr.rollback()
+        return result
+
+    @api.model
+    def _reconcile_chunk(self, payment_ids, account_ids=None, session_uid=False, dry_run=False,
+                         max_size=BATCH_MAX_COMBO_SIZE, search_limit=BATCH_SEARCH_LIMIT):
+        """Auto reconcile a chunk of payments and store their audit entries at once"""
+        cr = self.env.cr
+        queries_before = cr.sql_log_count
+        result = {'payments': len(payment_ids), 'matched': 0, 'skipped': 0}
+        log_entries = []
+        # Lines matched in this chunk, so a dry run does not count them twice
+        claimed_line_ids = set()
+
+        for payment in self.env['account.payment'].browse(payment_ids):
+            reconcile_account = payment._get_payment_reconcile_account(payment)
+            if not reconcile_account or (account_ids and reconcile_account.id not in account_ids):
+                result['skipped'] += 1
+                continue
+
+            payment_lines = payment.move_id.line_ids.filtered(
+                lambda l: l.account_id == reconcile_account and not l.reconciled
+            )
+            if not payment_lines:
+                result['skipped'] += 1
+                continue
+
+            matched_lines = payment._auto_reconcile_lines(
+                payment_lines, reconcile_account, origin='batch',
+                log_entries=log_entries, session_uid=session_uid, dry_run=dry_run,
+                max_size=max_size, search_limit=search_limit,
+                exclude_line_ids=claimed_line_ids,
+            )
+            if matched_lines:
+                result['matched'] += 1
+                claimed_line_ids.update(matched_lines.ids)
+
+        self.env['payment.reconcile.log']._write_log(log_entries)
+        self.env.flush_all()
+        result['queries'] = cr.sql_log_count - queries_before
+        self.env.invalidate_all()
+        return result
@@ -3,6 +3,8 @@
 # ============================================================================
 # models/payment_reconcile_widget.py
 
+import uuid
+
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 
@@ -50,6 +52,13 @@ class PaymentReconcileWidget(models.TransientModel):
         compute='_compute_available_lines'
     )
 
+    session_uid = fields.Char(
+        string='Session',
+        readonly=True,
+        copy=False,
+        default=lambda self: uuid.uuid4().hex
+    )
+
     selected_line_ids = fields.Many2many(
         'account.move.line',
         'payment_reconcile_selected_lines',
@@ -79,17 +88,17 @@ class PaymentReconcileWidget(models.TransientModel):
 
     @api.depends('payment_id', 'reconcile_account_id', 'partner_id')
     def _compute_available_lines(self):
-        """Find available lines for reconciliation from same account"""
+        """Find available lines for reconciliation from same account, most likely first"""
         for record in self:
             lines = self.env['account.move.line']
             if record.reconcile_account_id and record.partner_id and record.payment_id:
-                domain = [
-                    ('account_id', '=', record.reconcile_account_id.id),
-                    ('partner_id', '=', record.partner_id.id),
-                    ('reconciled', '=', False),
-                    ('move_id', '!=', record.payment_id.move_id.id)
-                ]
-                lines = self.env['account.move.line'].search(domain, limit=100)
+                payment_lines = record.payment_id.move_id.line_ids.filtered(
+                    lambda l: l.account_id == record.reconcile_account_id and not l.reconciled
+                )
+                rows = record.payment_id._get_reconcile_candidate_rows(
+                    record.reconcile_account_id, sum(payment_lines.mapped('amount_residual')), limit=100
+                )
+                lines = lines.browse([row[0] for row in rows])
             record.available_line_ids = lines
 
     def _get_payment_reconcile_account(self, payment):
@@ -171,16 +180,22 @@ class PaymentReconcileWidget(models.TransientModel):
         # Combine lines
         all_lines = payment_lines | self.selected_line_ids
 
-        # Check balance
+        # Check balance, differences within the tolerance are written off
         total_balance = sum(all_lines.mapped('balance'))
-        if abs(total_balance) > 0.01:
+        tolerance = self.payment_id._get_reconcile_tolerance()[0]
+        if abs(total_balance) > max(0.01, tolerance):
             raise UserError(_(
                 "Reconciliation is not balanced. Total balance: %.2f"
             ) % total_balance)
 
         # Perform reconciliation
         try:
-            all_lines.reconcile()
+            self.env['payment.reconcile.log']._write_log([
+                self.payment_id._reconcile_and_prepare_log(
+                    payment_lines, self.selected_line_ids, self.reconcile_account_id,
+                    'manual', 'widget', session_uid=self.session_uid,
+                )
+            ])
 
             return {
                 'type': 'ir.actions.client',
@@ -209,60 +224,58 @@ class PaymentReconcileWidget(models.TransientModel):
         if not payment_lines:
             raise UserError(_("No payment lines to reconcile."))
 
-        payment_balance = sum(payment_lines.mapped('balance'))
-
-        # Find exact match first
-        for line in self.available_line_ids:
-            if abs(line.balance + payment_balance) < 0.01:
-                try:
-                    all_lines = payment_lines | line
-                    all_lines.reconcile()
-                    return {
-                        'type': 'ir.actions.client',
-                        'tag': 'display_notification',
-                        'params': {
-                            'title': _('Success'),
-                            'message': _('Auto-reconciled with %s') % line.move_id.name,
-                            'type': 'success',
-                        }
-                    }
-                except:
-                    continue
-
-        # Try combinations
-        from itertools import combinations
-        lines_list = list(self.available_line_ids)
-
-        for combo_size in range(2, min(6, len(lines_list) + 1)):
-            for combo in combinations(lines_list, combo_size):
-                combo_balance = sum([l.balance for l in combo])
-                if abs(combo_balance + payment_balance) < 0.01:
-                    try:
-                        all_lines = payment_lines
-                        for line in combo:
-                            all_lines |= line
-                        all_lines.reconcile()
-                        return {
-                            'type': 'ir.actions.client',
-                            'tag': 'display_notification',
-                            'params': {
-                                'title': _('Success'),
-                                'message': _('Auto-reconciled with %d entries') % len(combo),
-                                'type': 'success',
-                            }
-                        }
-                    except:
-                        continue
+        # Exact matches are tried before combinations of up to 5 lines
+        matched_lines = self.payment_id._auto_reconcile_lines(
+            payment_lines, self.reconcile_account_id, origin='widget', limit=100,
+            session_uid=self.session_uid
+        )
+        if matched_lines:
+            if len(matched_lines) == 1:
+                message = _('Auto-reconciled with %s') % matched_lines.move_id.name
+            else:
+                message = _('Auto-reconciled with %d entries') % len(matched_lines)
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': _('Success'),
+                    'message': message,
+                    'type': 'success',
+                }
+            }
 
         raise UserError(_("No matching entries found for automatic reconciliation."))
 
-    def action_refresh(self):
-        """Refresh the widget data"""
-        # Clear selected lines and recompute
-        self.selected_line_ids = [(5, 0, 0)]
+    def action_undo_session(self):
+        """Remove every reconciliation made from this widget session"""
+        self.ensure_one()
+
+        removed = self.env['payment.reconcile.log']._undo_session(self.session_uid)
+        if not removed:
+            raise UserError(_("Nothing was reconciled in this session."))
+
         self._compute_available_lines()
         self._compute_payment_balance()
 
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Success'),
+                'message': _('%d reconciliations undone') % removed,
+                'type': 'success',
+            }
+        }
+
+    def action_refresh(self):
+        """Refresh the widget data, keeping the selection still available"""
+        self.ensure_one()
+        # Available lines are recomputed on reload; only drop selected lines
+        # reconciled meanwhile
+        removed_lines = self.selected_line_ids.filtered('reconciled')
+        if removed_lines:
+            self.selected_line_ids = [(3, line.id) for line in removed_lines]
+
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
@@ -271,4 +284,4 @@ class PaymentReconcileWidget(models.TransientModel):
                 'message': _('Data refreshed successfully'),
                 'type': 'info',
             }
-        }
\ No newline at end of file
+        }
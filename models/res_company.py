@@ -0,0 +1,31 @@
+# ============================================================================
+# RES COMPANY MODEL EXTENSION
+# ============================================================================
+# models/res_company.py
+
+from odoo import models, fields
+
+
+class ResCompany(models.Model):
+    _inherit = 'res.company'
+
+    payment_reconcile_tolerance = fields.Monetary(
+        string='Payment Reconcile Tolerance',
+        currency_field='currency_id',
+        help='Largest difference written off automatically when reconciling payments'
+    )
+
+    payment_reconcile_writeoff_account_id = fields.Many2one(
+        'account.account',
+        string='Payment Write-off Account',
+        check_company=True,
+        help='Account receiving the differences written off when reconciling payments'
+    )
+
+    payment_reconcile_candidate_order = fields.Selection([
+        ('due_date', 'Oldest Due Date'),
+        ('amount', 'Closest Amount'),
+        ('reference', 'Same Reference'),
+    ], string='Payment Candidate Priority', default='due_date', required=True,
+        help='Criterion ranking the lines proposed and matched first when reconciling payments; '
+             'the other criteria break ties')
@@ -0,0 +1,25 @@
+# ============================================================================
+# RES CONFIG SETTINGS MODEL EXTENSION
+# ============================================================================
+# models/res_config_settings.py
+
+from odoo import models, fields
+
+
+class ResConfigSettings(models.TransientModel):
+    _inherit = 'res.config.settings'
+
+    payment_reconcile_tolerance = fields.Monetary(
+        related='company_id.payment_reconcile_tolerance',
+        readonly=False
+    )
+
+    payment_reconcile_writeoff_account_id = fields.Many2one(
+        related='company_id.payment_reconcile_writeoff_account_id',
+        readonly=False
+    )
+
+    payment_reconcile_candidate_order = fields.Selection(
+        related='company_id.payment_reconcile_candidate_order',
+        readonly=False
+    )
@@ -12,6 +12,9 @@ class DirectPaymentReconcileController {
             availableLines: [],
             selectedLines: new Set(),
             reconcileAccount: null,
+            sessionUid: null,
+            lastSync: null,
+            candidateLimit: 0,
             summary: {
                 paymentBalance: 0,
                 selectedBalance: 0,
@@ -81,6 +84,9 @@ class DirectPaymentReconcileController {
             } else if (event.target.closest('button[name="action_refresh"]')) {
                 event.preventDefault();
                 this.refreshData();
+            } else if (event.target.closest('button[name="action_undo_session"]')) {
+                event.preventDefault();
+                this.performUndoSession();
             }
         });
 
@@ -161,7 +167,7 @@ class DirectPaymentReconcileController {
                 body: JSON.stringify({
                     jsonrpc: '2.0',
                     method: 'call',
-                    params: { payment_id: paymentId },
+                    params: { payment_id: paymentId, session_uid: this.state.sessionUid },
                     id: new Date().getTime()
                 })
             });
@@ -181,6 +187,9 @@ class DirectPaymentReconcileController {
             this.state.paymentData = data.payment || {};
             this.state.paymentLines = data.payment_move_lines || [];
             this.state.availableLines = data.reconcilable_lines || [];
+            this.state.sessionUid = data.session_uid || this.state.sessionUid;
+            this.state.lastSync = data.sync_time || null;
+            this.state.candidateLimit = data.candidate_limit || 0;
             this.state.reconcileAccount = {
                 id: data.payment.reconcile_account_id,
                 name: data.payment.reconcile_account_name
@@ -194,6 +203,74 @@ class DirectPaymentReconcileController {
         }
     }
 
+    async loadReconcileDelta() {
+        // Returns false when the shown list cannot be patched and needs a full reload
+        try {
+            const paymentId = this.getPaymentId();
+            if (!paymentId) {
+                return false;
+            }
+
+            const response = await fetch('/payment_reconcile/get_delta', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-Requested-With': 'XMLHttpRequest'
+                },
+                body: JSON.stringify({
+                    jsonrpc: '2.0',
+                    method: 'call',
+                    params: { payment_id: paymentId, since: this.state.lastSync },
+                    id: new Date().getTime()
+                })
+            });
+
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+
+            const result = await response.json();
+
+            if (result.error) {
+                throw new Error(result.error);
+            }
+
+            const data = result.result || {};
+            if (data.error) {
+                throw new Error(data.error);
+            }
+
+            // New lines may rank anywhere in the priority order, and removing
+            // lines from a capped list leaves room for unseen ones
+            const removedIds = new Set(data.removed_line_ids || []);
+            const shownIds = new Set(this.state.availableLines.map(line => line.id));
+            const changedLines = data.changed_lines || [];
+            const isCapped = this.state.candidateLimit &&
+                this.state.availableLines.length >= this.state.candidateLimit;
+            if (changedLines.some(line => !shownIds.has(line.id)) ||
+                (isCapped && [...removedIds].some(lineId => shownIds.has(lineId)))) {
+                return false;
+            }
+
+            // Patch the shown lines in place, keeping their order
+            const changedById = new Map(changedLines.map(line => [line.id, line]));
+            this.state.availableLines = this.state.availableLines
+                .filter(line => !removedIds.has(line.id))
+                .map(line => changedById.get(line.id) || line);
+            removedIds.forEach(lineId => this.state.selectedLines.delete(lineId));
+            this.state.paymentLines = data.payment_move_lines || this.state.paymentLines;
+            this.state.lastSync = data.sync_time || this.state.lastSync;
+
+            this.updateSummary();
+            return true;
+
+        } catch (error) {
+            // The full reload reports the error if it fails as well
+            console.error("Error loading reconcile delta:", error);
+            return false;
+        }
+    }
+
     handleLineSelection(event) {
         // Update selected lines tracking
         const lineElement = event.target.closest('tr');
@@ -248,6 +325,12 @@ class DirectPaymentReconcileController {
         this.updateBalanceDisplay();
     }
 
+    isBalanced() {
+        // Differences within the configured tolerance are written off
+        const tolerance = Math.max(0.01, this.state.paymentData.reconcile_tolerance || 0);
+        return Math.abs(this.state.summary.totalBalance) <= tolerance;
+    }
+
     updateBalanceDisplay() {
         const selectedBalanceElement = document.getElementById('selected_balance');
         if (selectedBalanceElement) {
@@ -255,7 +338,7 @@ class DirectPaymentReconcileController {
             selectedBalanceElement.textContent = `${currency}${this.state.summary.selectedBalance.toFixed(2)}`;
 
             // Color coding
-            if (Math.abs(this.state.summary.totalBalance) < 0.01) {
+            if (this.isBalanced()) {
                 selectedBalanceElement.className = 'text-success font-weight-bold';
             } else {
                 selectedBalanceElement.className = 'text-danger';
@@ -289,7 +372,7 @@ class DirectPaymentReconcileController {
                 body: JSON.stringify({
                     jsonrpc: '2.0',
                     method: 'call',
-                    params: { payment_id: paymentId },
+                    params: { payment_id: paymentId, session_uid: this.state.sessionUid },
                     id: new Date().getTime()
                 })
             });
@@ -325,7 +408,7 @@ class DirectPaymentReconcileController {
             return;
         }
 
-        if (Math.abs(this.state.summary.totalBalance) > 0.01) {
+        if (!this.isBalanced()) {
             this.showNotification("Reconciliation is not balanced. Please check your selection.", 'warning');
             return;
         }
@@ -348,7 +431,8 @@ class DirectPaymentReconcileController {
                     method: 'call',
                     params: {
                         payment_id: paymentId,
-                        selected_line_ids: selectedLineIds
+                        selected_line_ids: selectedLineIds,
+                        session_uid: this.state.sessionUid
                     },
                     id: new Date().getTime()
                 })
@@ -376,6 +460,53 @@ class DirectPaymentReconcileController {
         }
     }
 
+    async performUndoSession() {
+        if (this.state.isReconciling) return;
+
+        if (!this.state.sessionUid) {
+            this.showNotification("Nothing was reconciled in this session", 'warning');
+            return;
+        }
+
+        this.state.isReconciling = true;
+        this.updateReconcileButtonState();
+
+        try {
+            const response = await fetch('/payment_reconcile/undo_session', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-Requested-With': 'XMLHttpRequest'
+                },
+                body: JSON.stringify({
+                    jsonrpc: '2.0',
+                    method: 'call',
+                    params: { session_uid: this.state.sessionUid },
+                    id: new Date().getTime()
+                })
+            });
+
+            const result = await response.json();
+
+            if (result.error) {
+                throw new Error(result.error);
+            }
+            if (result.result && result.result.error) {
+                throw new Error(result.result.error);
+            }
+
+            this.showNotification(result.result.message || "Session undone", 'success');
+            await this.refreshData();
+
+        } catch (error) {
+            console.error("Undo session error:", error);
+            this.showNotification(`Undo failed: ${error.message}`, 'error');
+        } finally {
+            this.state.isReconciling = false;
+            this.updateReconcileButtonState();
+        }
+    }
+
     updateReconcileButtonState() {
         const autoBtn = document.querySelector('button[name="action_auto_reconcile"]');
         const manualBtn = document.querySelector('button[name="action_reconcile_selected"]');
@@ -391,7 +522,7 @@ class DirectPaymentReconcileController {
 
         if (manualBtn) {
             const hasSelection = this.state.selectedLines.size > 0;
-            const isBalanced = Math.abs(this.state.summary.totalBalance) < 0.01;
+            const isBalanced = this.isBalanced();
             const canReconcile = hasSelection && isBalanced && !this.state.isReconciling;
 
             manualBtn.disabled = !canReconcile;
@@ -410,8 +541,17 @@ class DirectPaymentReconcileController {
 
     async refreshData() {
         this.state.isLoading = true;
-        this.state.selectedLines.clear();
-        await this.loadReconcileData();
+        if (!this.state.lastSync || !(await this.loadReconcileDelta())) {
+            // Full reload, keeping the selected lines that are still available
+            await this.loadReconcileData();
+            const availableIds = new Set(this.state.availableLines.map(line => line.id));
+            this.state.selectedLines.forEach(lineId => {
+                if (!availableIds.has(lineId)) {
+                    this.state.selectedLines.delete(lineId);
+                }
+            });
+            this.updateSummary();
+        }
         this.updateUI();
         this.state.isLoading = false;
         this.showNotification("Data refreshed successfully", 'info');
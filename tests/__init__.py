@@ -0,0 +1,8 @@
+# ============================================================================
+# TESTS INIT FILE
+# ============================================================================
+# tests/__init__.py
+
+from . import test_reconcile_matcher
+from . import test_payment_reconcile_undo
+from . import test_payment_reconcile_candidates
@@ -0,0 +1,63 @@
+# ============================================================================
+# PAYMENT RECONCILE TEST COMMON
+# ============================================================================
+# tests/common.py
+
+from odoo import Command
+
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+
+
+class PaymentReconcileCommon(AccountTestInvoicingCommon):
+    """Customer payments and receivable entries of one dedicated partner"""
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        cls.receivable = cls.company_data['default_account_receivable']
+        cls.partner = cls.env['res.partner'].create({
+            'name': 'Reconcile Partner',
+            'property_account_receivable_id': cls.receivable.id,
+        })
+
+    @classmethod
+    def _create_receivable_line(cls, amount, date_maturity='2024-01-31', ref=False):
+        """Post a receivable entry of ``amount`` and return its receivable line"""
+        move = cls.env['account.move'].create({
+            'move_type': 'entry',
+            'journal_id': cls.company_data['default_journal_misc'].id,
+            'date': '2024-01-01',
+            'ref': ref,
+            'line_ids': [
+                Command.create({
+                    'account_id': cls.receivable.id,
+                    'partner_id': cls.partner.id,
+                    'debit': amount,
+                    'date_maturity': date_maturity,
+                }),
+                Command.create({
+                    'account_id': cls.company_data['default_account_revenue'].id,
+                    'credit': amount,
+                }),
+            ],
+        })
+        move.action_post()
+        return move.line_ids.filtered(lambda l: l.account_id == cls.receivable)
+
+    @classmethod
+    def _create_payment(cls, amount, ref=False):
+        """Post an inbound customer payment of ``amount``"""
+        payment = cls.env['account.payment'].create({
+            'payment_type': 'inbound',
+            'partner_type': 'customer',
+            'partner_id': cls.partner.id,
+            'amount': amount,
+            'date': '2024-02-01',
+            'ref': ref,
+            'journal_id': cls.company_data['default_journal_bank'].id,
+        })
+        payment.action_post()
+        return payment
+
+    def _payment_line(self, payment):
+        return payment.move_id.line_ids.filtered(lambda l: l.account_id == self.receivable)
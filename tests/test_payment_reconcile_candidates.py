@@ -0,0 +1,46 @@
+# ============================================================================
+# PAYMENT RECONCILE CANDIDATE ORDER TESTS
+# ============================================================================
+# tests/test_payment_reconcile_candidates.py
+
+from odoo.tests import tagged
+
+from .common import PaymentReconcileCommon
+
+
+@tagged('post_install', '-at_install')
+class TestPaymentReconcileCandidates(PaymentReconcileCommon):
+
+    def _candidate_ids(self, payment, **kwargs):
+        payment_residual = sum(self._payment_line(payment).mapped('amount_residual'))
+        rows = payment._get_reconcile_candidate_rows(self.receivable, payment_residual, **kwargs)
+        return [row[0] for row in rows]
+
+    def test_candidate_order(self):
+        self.company_data['company'].payment_reconcile_candidate_order = 'reference'
+        # The memo contains '%', passed to the query as a parameter
+        payment = self._create_payment(100.0, ref='50% deposit')
+        late_line = self._create_receivable_line(500.0, date_maturity='2024-03-31')
+        far_line = self._create_receivable_line(400.0, date_maturity='2024-01-31')
+        close_line = self._create_receivable_line(100.0, date_maturity='2024-01-31')
+        reference_line = self._create_receivable_line(
+            300.0, date_maturity='2024-06-30', ref='50% deposit'
+        )
+
+        # Same reference first, then oldest due date, then closest residual
+        expected = [reference_line.id, close_line.id, far_line.id, late_line.id]
+        self.assertEqual(self._candidate_ids(payment), expected)
+        self.assertEqual(self._candidate_ids(payment, limit=2), expected[:2])
+        self.assertEqual(
+            self._candidate_ids(payment, exclude_line_ids=[close_line.id]),
+            [reference_line.id, far_line.id, late_line.id],
+        )
+
+        # Partially reconciled lines rank on their residual
+        partial_payment = self._create_payment(350.0)
+        (self._payment_line(partial_payment) | far_line).reconcile()
+        self.assertAlmostEqual(far_line.amount_residual, 50.0)
+        other_close_line = self._create_receivable_line(60.0, date_maturity='2024-01-31')
+        self.assertEqual(
+            self._candidate_ids(payment)[1:4], [close_line.id, other_close_line.id, far_line.id]
+        )
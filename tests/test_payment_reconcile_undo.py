@@ -0,0 +1,54 @@
+# ============================================================================
+# PAYMENT RECONCILE UNDO TESTS
+# ============================================================================
+# tests/test_payment_reconcile_undo.py
+
+from odoo.tests import tagged
+
+from .common import PaymentReconcileCommon
+
+
+@tagged('post_install', '-at_install')
+class TestPaymentReconcileUndo(PaymentReconcileCommon):
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        cls.company_data['company'].write({
+            'payment_reconcile_tolerance': 1.0,
+            'payment_reconcile_writeoff_account_id': cls.company_data['default_account_expense'].id,
+        })
+
+    def test_undo_session(self):
+        Log = self.env['payment.reconcile.log']
+        payment = self._create_payment(100.0)
+        payment_line = self._payment_line(payment)
+        invoice_line = self._create_receivable_line(99.0)
+
+        matched_lines = payment._auto_reconcile_lines(
+            payment_line, self.receivable, session_uid='session-a'
+        )
+        self.assertEqual(matched_lines, invoice_line)
+        self.assertTrue(payment_line.reconciled)
+        writeoff_move = Log.search([('session_uid', '=', 'session-a')]).writeoff_move_id
+        self.assertTrue(writeoff_move, "The 1.00 difference should be written off")
+
+        # Reconciled outside the session, must survive the undo
+        other_payment_line = self._payment_line(self._create_payment(50.0))
+        other_line = self._create_receivable_line(50.0)
+        (other_payment_line | other_line).reconcile()
+
+        self.assertTrue(Log._undo_session('session-a'))
+        self.assertFalse(payment_line.reconciled)
+        self.assertFalse(invoice_line.reconciled)
+        self.assertAlmostEqual(payment_line.amount_residual, -100.0)
+        self.assertAlmostEqual(invoice_line.amount_residual, 99.0)
+        self.assertEqual(len(writeoff_move.reversal_move_id), 1)
+        self.assertTrue(other_payment_line.reconciled)
+        self.assertTrue(other_line.reconciled)
+
+        # Undoing twice does nothing more
+        self.assertEqual(Log._undo_session('session-a'), 0)
+        self.assertEqual(len(writeoff_move.reversal_move_id), 1)
+        self.assertFalse(payment_line.reconciled)
+        self.assertTrue(other_payment_line.reconciled)
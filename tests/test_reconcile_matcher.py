@@ -0,0 +1,72 @@
+# ============================================================================
+# RECONCILE MATCHER TESTS
+# ============================================================================
+# tests/test_reconcile_matcher.py
+
+from unittest.mock import patch
+
+from odoo.tests.common import BaseCase
+
+from ..tools import reconcile_matcher
+from ..tools.reconcile_matcher import ReconcileMatcher, to_cents
+
+
+class TestReconcileMatcher(BaseCase):
+    """Matcher checks, run with and without NumPy"""
+
+    def _matches(self, amounts, target, **kwargs):
+        ids = list(range(1, len(amounts) + 1))
+        results = []
+        for numpy_module in {reconcile_matcher.np, None}:
+            with patch.object(reconcile_matcher, 'np', numpy_module):
+                matcher = ReconcileMatcher(ids, amounts)
+                results.append(list(matcher.iter_matches(target, **kwargs)))
+        self.assertTrue(all(result == results[0] for result in results),
+                        "NumPy and pure Python paths disagree: %s" % results)
+        return results[0]
+
+    def test_to_cents(self):
+        self.assertEqual(to_cents(10.01), 1001)
+        self.assertEqual(to_cents(-0.1 - 0.2), -30)
+        self.assertEqual(to_cents(1.5, digits=3), 1500)
+        self.assertEqual(to_cents(None), 0)
+
+    def test_exact_single_before_pairs(self):
+        matches = self._matches([3000, 7000, 10000], 10000)
+        self.assertEqual(matches[0], (3,))
+        self.assertIn((1, 2), matches)
+
+    def test_no_match(self):
+        self.assertEqual(self._matches([100, 200], 1000), [])
+        self.assertEqual(self._matches([], 1000), [])
+
+    def test_pair_does_not_reuse_candidate(self):
+        self.assertEqual(self._matches([5000], 10000), [])
+        self.assertEqual(self._matches([5000, 5000], 10000), [(1, 2)])
+
+    def test_tolerance_prefers_exact_pair(self):
+        matches = self._matches([4900, 5000, 5000], 10000, tolerance=100)
+        self.assertEqual(matches[0], (2, 3))
+        self.assertIn((1, 3), matches)
+
+    def test_tolerance_prefers_exact_combination(self):
+        matches = self._matches([3000, 3000, 3900, 4000], 10000, max_size=3, tolerance=100)
+        self.assertEqual(matches[0], (1, 2, 4))
+
+    def test_tolerance_window(self):
+        self.assertEqual(self._matches([9950], 10000), [])
+        self.assertEqual(self._matches([9950], 10000, tolerance=50), [(1,)])
+        self.assertEqual(self._matches([9949], 10000, tolerance=50), [])
+
+    def test_max_size(self):
+        amounts = [1000, 2000, 3000]
+        self.assertEqual(self._matches(amounts, 6000, max_size=2), [])
+        self.assertEqual(self._matches(amounts, 6000, max_size=3), [(1, 2, 3)])
+
+    def test_search_limit(self):
+        amounts = [1000, 2000, 3000]
+        self.assertEqual(self._matches(amounts, 6000, search_limit=0), [])
+
+    def test_from_rows_keeps_priority(self):
+        matcher = ReconcileMatcher.from_rows([(7, 50.0), (3, 50.0)])
+        self.assertEqual(list(matcher.iter_matches(5000, max_size=1)), [(7,), (3,)])
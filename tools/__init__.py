@@ -0,0 +1,6 @@
+# ============================================================================
+# TOOLS INIT FILE
+# ============================================================================
+# tools/__init__.py
+
+from . import reconcile_matcher
@@ -0,0 +1,185 @@
+# ============================================================================
+# RECONCILE MATCHER
+# ============================================================================
+# tools/reconcile_matcher.py
+
+import bisect
+from itertools import combinations
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Largest number of lines combined with the payment in one match
+MAX_COMBO_SIZE = 5
+
+# Upper bound of partial combinations probed for matches of 3+ lines
+COMBINATION_SEARCH_LIMIT = 200000
+
+
+def to_cents(amount, digits=2):
+    """Convert a float amount to an integer in the smallest currency unit"""
+    return int(round((amount or 0.0) * 10 ** digits))
+
+
+class ReconcileMatcher:
+    """Find candidate lines whose amounts offset a target amount.
+
+    Amounts are integers in the smallest currency unit so every comparison is
+    exact. Candidates are sorted once; exact and pairwise matches are found
+    with binary searches (vectorized with NumPy when it is installed) instead
+    of summing record balances per combination. Among equally close matches,
+    candidates given first are preferred.
+    """
+
+    def __init__(self, ids, amounts):
+        self.ids = list(ids)
+        self.amounts = [int(amount) for amount in amounts]
+        self._order = sorted(range(len(self.amounts)), key=self.amounts.__getitem__)
+        self._sorted = [self.amounts[pos] for pos in self._order]
+        if np is not None:
+            self._np_amounts = np.array(self.amounts, dtype=np.int64)
+            self._np_order = np.array(self._order, dtype=np.int64)
+            self._np_sorted = np.array(self._sorted, dtype=np.int64)
+
+    @classmethod
+    def from_rows(cls, rows, digits=2):
+        """Build a matcher from ``(id, amount)`` rows, in priority order"""
+        return cls(
+            [row[0] for row in rows],
+            [to_cents(row[1], digits) for row in rows],
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def iter_matches(self, target, max_size=MAX_COMBO_SIZE, tolerance=0,
+                     search_limit=COMBINATION_SEARCH_LIMIT):
+        """Yield tuples of candidate ids whose amounts sum up to ``target``.
+
+        With a ``tolerance``, sums within ``target +/- tolerance`` also match;
+        each window is a pair of binary searches in the sorted amounts, so it
+        costs the same as an exact lookup. Smaller combinations are yielded
+        first, closest sums first, so callers can stop at the first match that
+        reconciles successfully: for one and two lines every candidate gets
+        its nearest partner, and larger combinations are searched exactly
+        before the tolerance window is opened.
+        """
+        size_limit = min(max_size, len(self.ids))
+        if size_limit >= 1:
+            for pos in self._single_positions(target, tolerance):
+                yield (self.ids[pos],)
+        if size_limit >= 2:
+            for first, second in self._pair_positions(target, tolerance):
+                yield (self.ids[first], self.ids[second])
+        budget = [search_limit]
+        for size in range(3, size_limit + 1):
+            seen = set()
+            for window in sorted({0, tolerance}):
+                for positions in self._combo_positions(target, size, window, budget):
+                    if positions not in seen:
+                        seen.add(positions)
+                        yield tuple(self.ids[pos] for pos in positions)
+            if budget[0] <= 0:
+                break
+
+    def _window(self, low, high):
+        """Sorted index range of the amounts between ``low`` and ``high``"""
+        left = bisect.bisect_left(self._sorted, low)
+        return left, bisect.bisect_right(self._sorted, high, left)
+
+    def _single_positions(self, target, tolerance):
+        if np is not None:
+            left = np.searchsorted(self._np_sorted, target - tolerance, side='left')
+            right = np.searchsorted(self._np_sorted, target + tolerance, side='right')
+            positions = self._np_order[left:right]
+            distance = np.abs(self._np_amounts[positions] - target)
+            return positions[np.lexsort((positions, distance))].tolist()
+
+        left, right = self._window(target - tolerance, target + tolerance)
+        return sorted(
+            self._order[left:right],
+            key=lambda pos: (abs(self.amounts[pos] - target), pos),
+        )
+
+    def _nearest_index(self, value, low, high, accept):
+        """Sorted index in ``[low, high)`` nearest to ``value`` passing ``accept``
+
+        Walks outwards from the insertion point of ``value``, so the exact
+        amount is found first when it is there.
+        """
+        after = bisect.bisect_left(self._sorted, value, low, high)
+        before = after - 1
+        while before >= low or after < high:
+            if after < high and (before < low or
+                                 self._sorted[after] - value <= value - self._sorted[before]):
+                if accept(after):
+                    return after
+                after += 1
+            else:
+                if accept(before):
+                    return before
+                before -= 1
+        return None
+
+    def _pair_positions(self, target, tolerance):
+        """Return the nearest partner of each candidate, as (lower, higher) position pairs"""
+        if np is not None:
+            return self._np_pair_positions(target, tolerance)
+
+        pairs = {}
+        for index, amount in enumerate(self._sorted):
+            complement = target - amount
+            left, right = self._window(complement - tolerance, complement + tolerance)
+            partner = self._nearest_index(complement, left, right, lambda other: other != index)
+            if partner is not None:
+                first, second = self._order[index], self._order[partner]
+                distance = abs(amount + self._sorted[partner] - target)
+                pairs[(min(first, second), max(first, second))] = distance
+        return sorted(pairs, key=lambda pair: (pairs[pair], pair[1], pair[0]))
+
+    def _np_pair_positions(self, target, tolerance):
+        sorted_amounts = self._np_sorted
+        size = len(sorted_amounts)
+        if not size:
+            return []
+        complement = target - sorted_amounts
+        index = np.arange(size)
+        # Nearest neighbours of the complement on each side, skipping the candidate itself
+        after = np.searchsorted(sorted_amounts, complement, side='left')
+        after = np.where(after == index, after + 1, after)
+        before = np.searchsorted(sorted_amounts, complement, side='left') - 1
+        before = np.where(before == index, before - 1, before)
+        after_distance = np.where(
+            after < size, np.abs(sorted_amounts[np.minimum(after, size - 1)] - complement), np.inf)
+        before_distance = np.where(
+            before >= 0, np.abs(sorted_amounts[np.maximum(before, 0)] - complement), np.inf)
+        use_after = after_distance <= before_distance
+        partner = np.where(use_after, after, before)
+        distance = np.minimum(after_distance, before_distance)
+        valid = distance <= tolerance
+        if not valid.any():
+            return []
+        index, partner, distance = index[valid], partner[valid], distance[valid].astype(np.int64)
+        first, second = self._np_order[index], self._np_order[partner]
+        pairs = np.unique(
+            np.stack([distance, np.maximum(first, second), np.minimum(first, second)], axis=1),
+            axis=0,
+        )
+        return [(low, high) for _distance, high, low in pairs.tolist()]
+
+    def _combo_positions(self, target, size, tolerance, budget):
+        """Complete each (size - 1) combination with its nearest remaining candidate"""
+        for prefix in combinations(range(len(self.amounts)), size - 1):
+            budget[0] -= 1
+            if budget[0] < 0:
+                return
+            last = prefix[-1]
+            complement = target - sum(self.amounts[pos] for pos in prefix)
+            left, right = self._window(complement - tolerance, complement + tolerance)
+            index = self._nearest_index(
+                complement, left, right, lambda other: self._order[other] > last
+            )
+            if index is not None:
+                yield prefix + (self._order[index],)